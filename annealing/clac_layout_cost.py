@@ -22,6 +22,23 @@ def normalize_probability_dictionary(probability_dictionary):
     return {key: float(value) / total_mass for key, value in probability_dictionary.items()}
 
 
+def normalize_corpus_weights(corpus_weights, corpus_names):
+    """
+    Mixing weights for the given corpora, summing to 1.0.
+    Corpora missing from corpus_weights get weight 0; None means an even blend.
+    """
+    if corpus_weights is None:
+        corpus_weights = {corpus_name: 1.0 for corpus_name in corpus_names}
+    unknown_names = set(corpus_weights) - set(corpus_names)
+    if unknown_names:
+        raise ValueError(f"Weights given for unknown corpora: {sorted(unknown_names)}")
+    negative_names = [corpus_name for corpus_name, weight in corpus_weights.items() if weight < 0]
+    if negative_names:
+        raise ValueError(f"Corpus weights must not be negative: {sorted(negative_names)}")
+    corpus_weights = normalize_probability_dictionary(corpus_weights)
+    return {corpus_name: corpus_weights.get(corpus_name, 0.0) for corpus_name in corpus_names}
+
+
 def compute_home_point(letter_coordinates):
     """
     Chooses a 'home' reference point as the average (mean) of all key coordinates.
@@ -173,6 +190,309 @@ def calculate_keyboard_cost_components(
     return digraph_cost, single_letter_cost, total_cost
 
 
+def calculate_keyboard_cost_by_corpus(
+    letter_coordinates,
+    corpora,
+    key_width=1.0,
+    intercept_a=0.0,
+    slope_b=1.0,
+    digraph_weight=1.0,
+    single_letter_weight=0.1,
+    normalize_inputs=True,
+):
+    """
+    calculate_keyboard_cost_components for every corpus in
+    corpora ({name: (digraph_probs, single_letter_probs)}).
+    Returns a dict name -> (digraph_cost, single_letter_cost, total_cost).
+    """
+    return {
+        corpus_name: calculate_keyboard_cost_components(
+            letter_coordinates,
+            digraph_probabilities,
+            single_letter_probabilities,
+            key_width=key_width,
+            intercept_a=intercept_a,
+            slope_b=slope_b,
+            digraph_weight=digraph_weight,
+            single_letter_weight=single_letter_weight,
+            normalize_inputs=normalize_inputs,
+        )
+        for corpus_name, (digraph_probabilities, single_letter_probabilities) in corpora.items()
+    }
+
+
+def validate_corpus_arguments(digraph_probabilities, single_letter_probabilities, corpora, logged_corpus_names):
+    """
+    Checks the arguments of an optimizer run: either a single corpus
+    (digraph / single-letter probabilities) or corpora, never both, and when
+    corpora are used the logger must have a column for each of them.
+    """
+    if corpora:
+        if digraph_probabilities is not None or single_letter_probabilities is not None:
+            raise ValueError("Pass either corpora or digraph/single-letter probabilities, not both.")
+        if set(logged_corpus_names) != set(corpora):
+            raise ValueError(
+                f"Logger corpus_names {sorted(logged_corpus_names)} do not match corpora {sorted(corpora)}."
+            )
+    elif digraph_probabilities is None or single_letter_probabilities is None:
+        raise ValueError("Digraph and single-letter probabilities are required when no corpora are given.")
+
+
+def blend_corpora(corpora, corpus_weights=None):
+    """
+    Collapses several corpora into one (digraph_probs, single_letter_probs) pair
+    that calculate_keyboard_cost can take directly. Each corpus is normalized
+    before mixing so the weights are the share of typed text from each corpus.
+    """
+    corpus_weights = normalize_corpus_weights(corpus_weights, list(corpora))
+    blended_digraphs = {}
+    blended_single_letters = {}
+    for corpus_name, (digraph_probabilities, single_letter_probabilities) in corpora.items():
+        corpus_weight = corpus_weights[corpus_name]
+        for digraph, probability in normalize_probability_dictionary(digraph_probabilities).items():
+            blended_digraphs[digraph] = blended_digraphs.get(digraph, 0.0) + corpus_weight * probability
+        for letter, probability in normalize_probability_dictionary(single_letter_probabilities).items():
+            blended_single_letters[letter] = blended_single_letters.get(letter, 0.0) + corpus_weight * probability
+    return blended_digraphs, blended_single_letters
+
+
+def layout_to_permutation(layout: dict, letters: list, positions: list):
+    """
+    Encodes a layout dict as a permutation: permutation[i] is the index in
+    `positions` of the key assigned to letters[i].
+    """
+    position_to_index = {tuple(position): index for index, position in enumerate(positions)}
+    return [position_to_index[tuple(layout[letter])] for letter in letters]
+
+
+def permutation_to_layout(permutation: list, letters: list, positions: list):
+    #Inverse of layout_to_permutation
+    return {letter: positions[permutation[index]] for index, letter in enumerate(letters)}
+
+
+def _build_position_tables(positions, key_width, intercept_a, slope_b):
+    #Fitts times between positions and distance of every position to the home point
+    position_coordinates = {index: position for index, position in enumerate(positions)}
+    _, fitts_time_by_position = build_fitts_cost_matrix_for_layout(
+        letter_coordinates=position_coordinates,
+        key_width=key_width,
+        intercept_a=intercept_a,
+        slope_b=slope_b,
+    )
+
+    home_x, home_y = compute_home_point(position_coordinates)
+    home_distance_by_position = [math.hypot(x - home_x, y - home_y) for x, y in positions]
+    return fitts_time_by_position, home_distance_by_position
+
+
+def _build_corpus_terms(letters, digraph_probabilities, single_letter_probabilities, normalize_inputs):
+    #Sparse (letter index, probability) terms of one corpus
+    if normalize_inputs:
+        digraph_probabilities = normalize_probability_dictionary(digraph_probabilities)
+        single_letter_probabilities = normalize_probability_dictionary(single_letter_probabilities)
+
+    letter_to_index = {letter: index for index, letter in enumerate(letters)}
+    digraph_terms = [
+        (letter_to_index[digraph[0]], letter_to_index[digraph[1]], float(digraph_probability))
+        for digraph, digraph_probability in digraph_probabilities.items()
+    ]
+    single_letter_terms = [
+        (letter_to_index[letter], float(letter_probability))
+        for letter, letter_probability in single_letter_probabilities.items()
+    ]
+    return digraph_terms, single_letter_terms
+
+
+def build_permutation_cost_tables(
+    letters,
+    positions,
+    digraph_probabilities,
+    single_letter_probabilities,
+    key_width=1.0,
+    intercept_a=0.0,
+    slope_b=1.0,
+    normalize_inputs=True,
+):
+    """
+    Precomputes everything calculate_keyboard_cost needs when only the
+    assignment of letters to a fixed set of positions changes.
+
+    The home point only depends on the set of positions, so the distance of
+    every position to it is constant across layouts. A layout then reduces to
+    a permutation and its cost to table lookups.
+    Returns a dict with:
+      letters, positions
+      fitts_time_by_position: 2D list [p][q] = fitts_time(position_p -> position_q)
+      home_distance_by_position: list [p] = distance(position_p, home_point)
+      digraph_terms: list of (from_letter_index, to_letter_index, probability)
+      single_letter_terms: list of (letter_index, probability)
+    """
+    fitts_time_by_position, home_distance_by_position = _build_position_tables(
+        positions, key_width, intercept_a, slope_b
+    )
+    digraph_terms, single_letter_terms = _build_corpus_terms(
+        letters, digraph_probabilities, single_letter_probabilities, normalize_inputs
+    )
+
+    return {
+        "letters": list(letters),
+        "positions": list(positions),
+        "fitts_time_by_position": fitts_time_by_position,
+        "home_distance_by_position": home_distance_by_position,
+        "digraph_terms": digraph_terms,
+        "single_letter_terms": single_letter_terms,
+    }
+
+
+def load_corpus(digraph_file_path, single_letter_file_path):
+    #A corpus is a (digraph_probabilities, single_letter_probabilities) pair
+    return (
+        load_probability_dictionary_from_txt(digraph_file_path),
+        load_probability_dictionary_from_txt(single_letter_file_path),
+    )
+
+
+def build_corpus_cost_tables(
+    letters,
+    positions,
+    corpora,
+    key_width=1.0,
+    intercept_a=0.0,
+    slope_b=1.0,
+    normalize_inputs=True,
+):
+    """
+    Same as build_permutation_cost_tables but for several named corpora.
+
+    corpora: dict like {'es': (digraph_probs, single_letter_probs), 'code': (...)}
+    The position tables are shared; the terms of each corpus are kept apart under
+    'corpora' -> name -> {'digraph_terms', 'single_letter_terms'}.
+    The cost is linear in the probabilities, so a blend is just a weighted sum of
+    these (see blend_corpus_cost_tables and combine_corpus_costs) and changing the
+    weights never needs the corpora to be re-counted or the tables rebuilt.
+    """
+    if not corpora:
+        raise ValueError("At least one corpus is required.")
+
+    fitts_time_by_position, home_distance_by_position = _build_position_tables(
+        positions, key_width, intercept_a, slope_b
+    )
+    corpus_terms = {}
+    for corpus_name, (digraph_probabilities, single_letter_probabilities) in corpora.items():
+        digraph_terms, single_letter_terms = _build_corpus_terms(
+            letters, digraph_probabilities, single_letter_probabilities, normalize_inputs
+        )
+        corpus_terms[corpus_name] = {
+            "digraph_terms": digraph_terms,
+            "single_letter_terms": single_letter_terms,
+        }
+
+    return {
+        "letters": list(letters),
+        "positions": list(positions),
+        "fitts_time_by_position": fitts_time_by_position,
+        "home_distance_by_position": home_distance_by_position,
+        "corpora": corpus_terms,
+    }
+
+
+def blend_corpus_cost_tables(corpus_cost_tables, corpus_weights=None):
+    """
+    Merges the per-corpus terms into a single set of digraph / single-letter
+    terms weighted by corpus_weights. The result has the same shape as
+    build_permutation_cost_tables, so calculate_permutation_costs_batch
+    evaluates the blended cost at single-corpus speed.
+    """
+    corpus_terms = corpus_cost_tables["corpora"]
+    corpus_weights = normalize_corpus_weights(corpus_weights, list(corpus_terms))
+
+    digraph_mass = {}
+    single_letter_mass = {}
+    for corpus_name, terms in corpus_terms.items():
+        corpus_weight = corpus_weights[corpus_name]
+        if corpus_weight == 0.0:
+            continue
+        for from_index, to_index, digraph_probability in terms["digraph_terms"]:
+            key = (from_index, to_index)
+            digraph_mass[key] = digraph_mass.get(key, 0.0) + corpus_weight * digraph_probability
+        for letter_index, letter_probability in terms["single_letter_terms"]:
+            single_letter_mass[letter_index] = single_letter_mass.get(letter_index, 0.0) + corpus_weight * letter_probability
+
+    blended_tables = {key: value for key, value in corpus_cost_tables.items() if key != "corpora"}
+    blended_tables["digraph_terms"] = [
+        (from_index, to_index, probability) for (from_index, to_index), probability in digraph_mass.items()
+    ]
+    blended_tables["single_letter_terms"] = list(single_letter_mass.items())
+    return blended_tables
+
+
+def calculate_permutation_costs_batch(
+    cost_tables,
+    permutations,
+    digraph_weight=1.0,
+    single_letter_weight=0.1,
+):
+    """
+    Evaluates many permutation layouts in one call against tables from
+    build_permutation_cost_tables.
+    Returns a list of (digraph_cost, single_letter_cost, total_cost), one per
+    permutation, matching calculate_keyboard_cost_components.
+    """
+    fitts_time_by_position = cost_tables["fitts_time_by_position"]
+    home_distance_by_position = cost_tables["home_distance_by_position"]
+    digraph_terms = cost_tables["digraph_terms"]
+    single_letter_terms = cost_tables["single_letter_terms"]
+
+    results = []
+    for permutation in permutations:
+        digraph_cost = 0.0
+        for from_index, to_index, digraph_probability in digraph_terms:
+            digraph_cost += digraph_probability * fitts_time_by_position[permutation[from_index]][permutation[to_index]]
+
+        single_letter_cost = 0.0
+        for letter_index, letter_probability in single_letter_terms:
+            single_letter_cost += letter_probability * home_distance_by_position[permutation[letter_index]]
+
+        total_cost = digraph_weight * digraph_cost + single_letter_weight * single_letter_cost
+        results.append((digraph_cost, single_letter_cost, total_cost))
+    return results
+
+
+def calculate_corpus_costs_batch(
+    corpus_cost_tables,
+    permutations,
+    digraph_weight=1.0,
+    single_letter_weight=0.1,
+):
+    """
+    Evaluates many permutation layouts against every corpus in tables from
+    build_corpus_cost_tables.
+    Returns a list with one dict per permutation: corpus name -> (digraph_cost, single_letter_cost, total_cost)
+    """
+    results = [{} for _ in permutations]
+    shared_tables = {key: value for key, value in corpus_cost_tables.items() if key != "corpora"}
+    for corpus_name, terms in corpus_cost_tables["corpora"].items():
+        corpus_tables = dict(shared_tables, **terms)
+        corpus_components = calculate_permutation_costs_batch(
+            corpus_tables, permutations, digraph_weight, single_letter_weight
+        )
+        for result, components in zip(results, corpus_components):
+            result[corpus_name] = components
+    return results
+
+
+def combine_corpus_costs(corpus_costs, corpus_weights=None):
+    """
+    Blends one result of calculate_corpus_costs_batch (or
+    calculate_keyboard_cost_by_corpus) into (digraph_cost, single_letter_cost, total_cost).
+    """
+    corpus_weights = normalize_corpus_weights(corpus_weights, list(corpus_costs))
+    return tuple(
+        sum(corpus_weights[corpus_name] * components[part] for corpus_name, components in corpus_costs.items())
+        for part in range(3)
+    )
+
+
 
 qwerty_pos = {
     'q': (1.5, 0), 'w': (2.5, 0), 'e': (3.5, 0), 'r': (4.5, 0),
@@ -189,8 +509,9 @@ qwerty_pos = {
     'm': (8.25, 2),
 }
 
-digraph_probs = load_probability_dictionary_from_txt("annealing/files/digraphs_prob.txt")
-char_probs = load_probability_dictionary_from_txt("annealing/files/single_char_prob.txt")
+if __name__ == "__main__":
+    digraph_probs = load_probability_dictionary_from_txt("annealing/files/digraphs_prob.txt")
+    char_probs = load_probability_dictionary_from_txt("annealing/files/single_char_prob.txt")
 
-keyboard_cost = calculate_keyboard_cost(qwerty_pos, digraph_probs, char_probs)
-print(keyboard_cost)
+    keyboard_cost = calculate_keyboard_cost(qwerty_pos, digraph_probs, char_probs)
+    print(keyboard_cost)
@@ -0,0 +1,371 @@
+import math
+import os
+import random
+from multiprocessing import Pool
+from clac_layout_cost import *
+from progress_logger import ProgressLogger
+from simulated_annealing_keyboard import write_best_layout_snapshot
+from layout_bounds import compute_lower_bound, optimality_gap
+
+
+# Layouts are handled as permutations here: permutation[i] is the index in
+# `positions` of the key holding letters[i] (see layout_to_permutation).
+
+def random_permutation(size: int, rng=random):
+    permutation = list(range(size))
+    rng.shuffle(permutation)
+    return permutation
+
+
+def order_crossover(parent_1: list, parent_2: list, rng=random):
+    """
+    OX: copies a random slice from parent_1 and fills the remaining slots with
+    the missing genes in the order they appear in parent_2 (starting after the slice).
+    """
+    size = len(parent_1)
+    start, end = sorted(rng.sample(range(size + 1), 2))
+    child = [None] * size
+    child[start:end] = parent_1[start:end]
+    taken = set(parent_1[start:end])
+
+    fill_index = end % size
+    for offset in range(size):
+        gene = parent_2[(end + offset) % size]
+        if gene in taken:
+            continue
+        child[fill_index] = gene
+        fill_index = (fill_index + 1) % size
+    return child
+
+
+def cycle_crossover(parent_1: list, parent_2: list, rng=random):
+    """
+    CX: splits the parents into cycles and takes alternate cycles from each,
+    so every gene keeps the slot it had in one of the parents.
+    """
+    size = len(parent_1)
+    position_in_parent_1 = {gene: index for index, gene in enumerate(parent_1)}
+    child = [None] * size
+    take_from_parent_1 = rng.random() < 0.5
+
+    for start in range(size):
+        if child[start] is not None:
+            continue
+        index = start
+        while child[index] is None:
+            child[index] = parent_1[index] if take_from_parent_1 else parent_2[index]
+            index = position_in_parent_1[parent_2[index]]
+        take_from_parent_1 = not take_from_parent_1
+    return child
+
+
+def swap_mutation(permutation: list, mutation_rate: float, rng=random):
+    """
+    Same move as swap_two_letters, applied a geometric number of times: the
+    first swap happens with probability mutation_rate and each further swap
+    with the same probability, so 0.0 disables mutation.
+    """
+    mutated = list(permutation)
+    swap_count = 0
+    while rng.random() < mutation_rate:
+        swap_count += 1
+    for _ in range(swap_count):
+        index_1, index_2 = rng.sample(range(len(mutated)), 2)
+        mutated[index_1], mutated[index_2] = mutated[index_2], mutated[index_1]
+    return mutated
+
+
+def tournament_select(population: list, costs: list, tournament_size: int, rng=random):
+    # Returns the index of the winner
+    contenders = rng.sample(range(len(population)), tournament_size)
+    return min(contenders, key=lambda index: costs[index])
+
+
+def local_search_polish(permutation: list, cost_tables: dict, max_passes=2, digraph_weight=1.0, single_letter_weight=0.1):
+    """
+    Best-improvement swap search. Each pass scores every pairwise swap of the
+    current permutation in a single batched call and keeps the best one while it improves.
+    """
+    current = list(permutation)
+    current_components = calculate_permutation_costs_batch(cost_tables, [current], digraph_weight, single_letter_weight)[0]
+    size = len(current)
+    swap_pairs = [(i, j) for i in range(size) for j in range(i + 1, size)]
+
+    for _ in range(max_passes):
+        neighbours = []
+        for i, j in swap_pairs:
+            neighbour = list(current)
+            neighbour[i], neighbour[j] = neighbour[j], neighbour[i]
+            neighbours.append(neighbour)
+        neighbour_components = calculate_permutation_costs_batch(cost_tables, neighbours, digraph_weight, single_letter_weight)
+        best_index = min(range(len(neighbours)), key=lambda index: neighbour_components[index][2])
+        if neighbour_components[best_index][2] >= current_components[2]:
+            break
+        current = neighbours[best_index]
+        current_components = neighbour_components[best_index]
+    return current, current_components
+
+
+# --- Process pool workers ---
+# The cost tables are sent once per worker through the initializer instead of
+# being pickled with every task.
+
+_worker_state = {}
+
+
+def _init_worker(cost_tables, digraph_weight, single_letter_weight):
+    _worker_state["cost_tables"] = cost_tables
+    _worker_state["digraph_weight"] = digraph_weight
+    _worker_state["single_letter_weight"] = single_letter_weight
+
+
+def _evaluate_chunk(permutations):
+    return calculate_permutation_costs_batch(
+        _worker_state["cost_tables"],
+        permutations,
+        _worker_state["digraph_weight"],
+        _worker_state["single_letter_weight"],
+    )
+
+
+def _breed_and_evaluate(task):
+    parent_pairs, crossover_name, mutation_rate, seed = task
+    rng = random.Random(seed)
+    crossover = order_crossover if crossover_name == "order" else cycle_crossover
+
+    children = []
+    for parent_1, parent_2 in parent_pairs:
+        child = crossover(parent_1, parent_2, rng)
+        child = swap_mutation(child, mutation_rate, rng)
+        children.append(child)
+
+    components = calculate_permutation_costs_batch(
+        _worker_state["cost_tables"],
+        children,
+        _worker_state["digraph_weight"],
+        _worker_state["single_letter_weight"],
+    )
+    return children, components
+
+
+def _polish(task):
+    permutation, max_passes = task
+    return local_search_polish(
+        permutation,
+        _worker_state["cost_tables"],
+        max_passes=max_passes,
+        digraph_weight=_worker_state["digraph_weight"],
+        single_letter_weight=_worker_state["single_letter_weight"],
+    )
+
+
+def _split_into_chunks(items: list, chunk_count: int):
+    chunk_size = max(1, math.ceil(len(items) / chunk_count))
+    return [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+
+
+def genetic_optimize_layout(letters: list,
+                            positions: list,
+                            letter_probs: dict,
+                            digraph_probs: dict,
+                            population_size: int,
+                            generations: int,
+                            elite_count: int,
+                            mutation_rate: float,
+                            logger: ProgressLogger,
+                            crossover="order",
+                            tournament_size=3,
+                            polish_elites=True,
+                            polish_passes=2,
+                            processes=None,
+                            initial_layouts=None,
+                            snapshot_path="annealing/progress_logs/current_best_layout.json",
+                            digraph_weight=1.0,
+                            single_letter_weight=0.1,
+                            corpora=None,
+                            corpus_weights=None,
+                            stop_gap=None,
+                            seed=None
+                            ):
+    """
+    Generational genetic search over permutation layouts (memetic when
+    polish_elites is set). Breeding and evaluation of each generation are
+    split across a process pool, one batched cost call per chunk.
+
+    With corpora ({name: (digraph_probs, single_letter_probs)}) the blend given by
+    corpus_weights is optimized and the best layout's cost under each corpus is
+    logged every generation; letter_probs / digraph_probs must then be None and
+    the logger needs matching corpus_names.
+    stop_gap ends the search once (best_cost - lower_bound) / lower_bound <= stop_gap,
+    i.e. the best cost is provably within that fraction of the optimum. The bound
+    is computed here from the same tables and weights the search minimizes.
+    """
+    if crossover not in ("order", "cycle"):
+        raise ValueError(f"Unknown crossover: {crossover}")
+    if not 0 < elite_count < population_size:
+        raise ValueError("elite_count must be between 1 and population_size - 1")
+    if not 0.0 <= mutation_rate < 1.0:
+        # swap_mutation draws a geometric number of swaps; a rate of 1.0 would never stop
+        raise ValueError("mutation_rate must be in [0, 1)")
+    validate_corpus_arguments(digraph_probs, letter_probs, corpora, logger.corpus_names)
+
+    rng = random.Random(seed)
+    processes = processes or os.cpu_count() or 1
+    if corpora:
+        corpus_cost_tables = build_corpus_cost_tables(letters, positions, corpora)
+        cost_tables = blend_corpus_cost_tables(corpus_cost_tables, corpus_weights)
+    else:
+        corpus_cost_tables = None
+        cost_tables = build_permutation_cost_tables(letters, positions, digraph_probs, letter_probs)
+
+    lower_bound = None
+    if logger.log_gap or stop_gap is not None:
+        lower_bound = compute_lower_bound(cost_tables, digraph_weight, single_letter_weight)["lower_bound"]
+        logger.lower_bound = lower_bound
+
+    population = [layout_to_permutation(layout, letters, positions) for layout in (initial_layouts or [])]
+    while len(population) < population_size:
+        population.append(random_permutation(len(letters), rng))
+    population = population[:population_size]
+
+    best_cost_history = []
+    mean_cost_history = []
+    # Elites that are already swap-local optima; they carry over unchanged so need no second polish
+    polished_elites = set()
+
+    with Pool(processes, initializer=_init_worker, initargs=(cost_tables, digraph_weight, single_letter_weight)) as pool:
+        components = []
+        for chunk_components in pool.map(_evaluate_chunk, _split_into_chunks(population, processes)):
+            components.extend(chunk_components)
+
+        best_index = min(range(population_size), key=lambda index: components[index][2])
+        best_permutation = population[best_index]
+        best_components = components[best_index]
+
+        for generation in range(generations):
+            costs = [component[2] for component in components]
+            ranked = sorted(range(population_size), key=lambda index: costs[index])
+            elites = [population[index] for index in ranked[:elite_count]]
+            elite_components = [components[index] for index in ranked[:elite_count]]
+
+            if polish_elites:
+                to_polish = [index for index, elite in enumerate(elites) if tuple(elite) not in polished_elites]
+                polished = pool.map(_polish, [(elites[index], polish_passes) for index in to_polish])
+                for index, (permutation, elite_component) in zip(to_polish, polished):
+                    elites[index] = permutation
+                    elite_components[index] = elite_component
+                polished_elites = {tuple(elite) for elite in elites}
+
+            offspring_count = population_size - elite_count
+            parent_indices = [
+                (tournament_select(population, costs, tournament_size, rng),
+                 tournament_select(population, costs, tournament_size, rng))
+                for _ in range(offspring_count)
+            ]
+            parent_pairs = [(population[index_1], population[index_2]) for index_1, index_2 in parent_indices]
+            tasks = [
+                (chunk, crossover, mutation_rate, rng.getrandbits(32))
+                for chunk in _split_into_chunks(parent_pairs, processes)
+            ]
+            children = []
+            children_components = []
+            for chunk_children, chunk_components in pool.map(_breed_and_evaluate, tasks):
+                children.extend(chunk_children)
+                children_components.extend(chunk_components)
+
+            # "Accepted" offspring are the ones that beat their better parent
+            accepted_moves = sum(
+                1 for component, (index_1, index_2) in zip(children_components, parent_indices)
+                if component[2] < min(costs[index_1], costs[index_2])
+            )
+
+            population = elites + children
+            components = elite_components + children_components
+
+            generation_best_index = min(range(population_size), key=lambda index: components[index][2])
+            if components[generation_best_index][2] < best_components[2]:
+                best_permutation = population[generation_best_index]
+                best_components = components[generation_best_index]
+            # Written every generation so the elites in the snapshot stay current on plateaus
+            write_best_layout_snapshot(
+                permutation_to_layout(best_permutation, letters, positions),
+                best_components[2],
+                snapshot_path,
+                elites=[
+                    (permutation_to_layout(elite, letters, positions), elite_component[2])
+                    for elite, elite_component in zip(elites, elite_components)
+                ],
+            )
+
+            mean_cost = sum(component[2] for component in components) / population_size
+            best_cost_history.append(best_components[2])
+            mean_cost_history.append(mean_cost)
+
+            corpus_costs = None
+            if corpus_cost_tables is not None:
+                best_corpus_components = calculate_corpus_costs_batch(
+                    corpus_cost_tables, [best_permutation], digraph_weight, single_letter_weight
+                )[0]
+                corpus_costs = {name: components[2] for name, components in best_corpus_components.items()}
+
+            print(f"generation={generation + 1}  mean={mean_cost:.3f}  best={best_components[2]:.3f}")
+            # Temperature is not meaningful here; the population mean stands in for the current cost
+            logger.log(
+                None,
+                mean_cost,
+                best_components[2],
+                accepted_moves,
+                offspring_count,
+                digraph_cost=best_components[0],
+                single_letter_cost=best_components[1],
+                corpus_costs=corpus_costs
+            )
+
+            gap = optimality_gap(best_components[2], lower_bound)
+            if stop_gap is not None and gap is not None and gap <= stop_gap:
+                print(f"Stopping: best cost is within {gap:.2%} of the lower bound")
+                break
+
+    logger.close()
+    return {
+        "best_layout": permutation_to_layout(best_permutation, letters, positions),
+        "best_cost": best_components[2],
+        "best_cost_history": best_cost_history,
+        "mean_cost_history": mean_cost_history
+    }
+
+
+if __name__ == "__main__":
+    letters = list("abcdefghijklmnopqrstuvwxyzñ")
+    positions =[(1.5, 0),(2.5, 0),(3.5, 0),(4.5, 0),(5.5, 0),(6.5, 0),(7.5, 0),(8.5, 0),(9.5, 0),(10.5, 0),
+                (1.75, 1),(2.75, 1),(3.75, 1),(4.75, 1),(5.75, 1),(6.75, 1),(7.75, 1),(8.75, 1),(9.75, 1),(10.75, 1),
+                (2.25, 2),(3.25, 2),(4.25, 2),(5.25, 2),(6.25, 2),(7.25, 2),(8.25, 2)]
+
+    letter_probs = load_probability_dictionary_from_txt("annealing/files/single_char_prob.txt")
+    digraph_probs = load_probability_dictionary_from_txt("annealing/files/digraphs_prob.txt")
+
+    file_counter = 1
+    # Skip numbers left behind by interrupted runs too (progress CSV without results)
+    while (os.path.exists(f"annealing/result_log/results{file_counter}.txt")
+           or os.path.exists(f"annealing/progress_logs/annealing_progress{file_counter}.csv")):
+        file_counter += 1
+
+    logger = ProgressLogger(
+        filename=f"annealing/progress_logs/annealing_progress{file_counter}.csv",
+        log_every=1,
+        log_gap=True
+    )
+
+    best_layout, best_cost, best_cost_history, mean_cost_history = genetic_optimize_layout(letters,
+                                                                                          positions,
+                                                                                          letter_probs,
+                                                                                          digraph_probs,
+                                                                                          population_size = 200,
+                                                                                          generations = 300,
+                                                                                          elite_count = 4,
+                                                                                          mutation_rate = 0.3,
+                                                                                          logger=logger).values()
+
+    results = open(f"annealing/result_log/results{file_counter}.txt", "x")
+    results.write(f"{best_layout}\n{best_cost}\n{best_cost_history}\n{mean_cost_history}")
+    print("Finalized")
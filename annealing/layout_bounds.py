@@ -0,0 +1,289 @@
+import ast
+import os
+from clac_layout_cost import *
+
+
+# The layout cost is a quadratic assignment problem (QAP) over permutations
+# (permutation[a] = position of letter a, see layout_to_permutation):
+#   cost = Σ_a Σ_b flow[a][b] * distance[perm[a]][perm[b]] + Σ_a linear[a][perm[a]]
+# flow is the weighted digraph matrix, distance the Fitts time between positions
+# and linear the weighted single-letter term.
+
+def build_qap_matrices(cost_tables, digraph_weight=1.0, single_letter_weight=0.1):
+    """
+    Dense QAP matrices from tables built by build_permutation_cost_tables
+    (or blend_corpus_cost_tables).
+    Returns a dict with flow[a][b], distance[p][q] and linear[a][p].
+    """
+    size = len(cost_tables["letters"])
+    distance = cost_tables["fitts_time_by_position"]
+    home_distance_by_position = cost_tables["home_distance_by_position"]
+
+    flow = [[0.0] * size for _ in range(size)]
+    for from_index, to_index, digraph_probability in cost_tables["digraph_terms"]:
+        flow[from_index][to_index] += digraph_weight * digraph_probability
+
+    letter_probability = [0.0] * size
+    for letter_index, probability in cost_tables["single_letter_terms"]:
+        letter_probability[letter_index] += probability
+
+    linear = [
+        [single_letter_weight * letter_probability[letter_index] * home_distance_by_position[position_index]
+         for position_index in range(size)]
+        for letter_index in range(size)
+    ]
+    return {"flow": flow, "distance": distance, "linear": linear}
+
+
+def solve_linear_assignment(cost_matrix):
+    """
+    Hungarian algorithm (O(n^3)) for a square cost matrix.
+    Returns (assignment, total_cost) where assignment[row] = column.
+    """
+    size = len(cost_matrix)
+    infinity = float("inf")
+    # 1-based potentials; column 0 is a virtual start column
+    row_potential = [0.0] * (size + 1)
+    column_potential = [0.0] * (size + 1)
+    row_of_column = [0] * (size + 1)
+    previous_column = [0] * (size + 1)
+
+    for row in range(1, size + 1):
+        row_of_column[0] = row
+        current_column = 0
+        min_slack = [infinity] * (size + 1)
+        used = [False] * (size + 1)
+        while True:
+            used[current_column] = True
+            current_row = row_of_column[current_column]
+            delta = infinity
+            next_column = 0
+            for column in range(1, size + 1):
+                if used[column]:
+                    continue
+                slack = cost_matrix[current_row - 1][column - 1] - row_potential[current_row] - column_potential[column]
+                if slack < min_slack[column]:
+                    min_slack[column] = slack
+                    previous_column[column] = current_column
+                if min_slack[column] < delta:
+                    delta = min_slack[column]
+                    next_column = column
+            for column in range(size + 1):
+                if used[column]:
+                    row_potential[row_of_column[column]] += delta
+                    column_potential[column] -= delta
+                else:
+                    min_slack[column] -= delta
+            current_column = next_column
+            if row_of_column[current_column] == 0:
+                break
+        while current_column:
+            column = previous_column[current_column]
+            row_of_column[current_column] = row_of_column[column]
+            current_column = column
+
+    assignment = [0] * size
+    for column in range(1, size + 1):
+        assignment[row_of_column[column] - 1] = column - 1
+    total_cost = sum(cost_matrix[row][assignment[row]] for row in range(size))
+    return assignment, total_cost
+
+
+def _minimum_scalar_product(values_1, values_2):
+    # Rearrangement inequality: ascending against descending gives the smallest sum
+    return sum(a * b for a, b in zip(sorted(values_1), sorted(values_2, reverse=True)))
+
+
+def gilmore_lawler_bound(cost_tables, digraph_weight=1.0, single_letter_weight=0.1):
+    """
+    Gilmore-Lawler lower bound. For every letter a on position p the digraphs
+    leaving a cost at least the minimum scalar product of a's flow row and p's
+    distance row (diagonals excluded); adding the linear term and solving the
+    resulting assignment problem exactly bounds every layout from below.
+    """
+    matrices = build_qap_matrices(cost_tables, digraph_weight, single_letter_weight)
+    flow = matrices["flow"]
+    distance = matrices["distance"]
+    linear = matrices["linear"]
+    size = len(flow)
+
+    off_diagonal_flow = [[flow[a][b] for b in range(size) if b != a] for a in range(size)]
+    off_diagonal_distance = [[distance[p][q] for q in range(size) if q != p] for p in range(size)]
+
+    bound_matrix = [
+        [linear[a][p] + flow[a][a] * distance[p][p] + _minimum_scalar_product(off_diagonal_flow[a], off_diagonal_distance[p])
+         for p in range(size)]
+        for a in range(size)
+    ]
+    _, bound = solve_linear_assignment(bound_matrix)
+    return bound
+
+
+def single_letter_assignment_bound(cost_tables, digraph_weight=1.0, single_letter_weight=0.1):
+    """
+    Exact optimum of the single-letter term alone (it has product form, so
+    sorting solves the assignment) plus the cheapest possible Fitts time for
+    every digraph.
+    """
+    matrices = build_qap_matrices(cost_tables, digraph_weight, single_letter_weight)
+    flow = matrices["flow"]
+    distance = matrices["distance"]
+    size = len(flow)
+
+    letter_probability = [0.0] * size
+    for letter_index, probability in cost_tables["single_letter_terms"]:
+        letter_probability[letter_index] += probability
+    single_letter_bound = single_letter_weight * _minimum_scalar_product(
+        cost_tables["home_distance_by_position"], letter_probability
+    )
+
+    min_off_diagonal_distance = min(distance[p][q] for p in range(size) for q in range(size) if p != q)
+    min_diagonal_distance = min(distance[p][p] for p in range(size))
+    digraph_bound = sum(
+        flow[a][b] * (min_diagonal_distance if a == b else min_off_diagonal_distance)
+        for a in range(size) for b in range(size)
+    )
+    return single_letter_bound + digraph_bound
+
+
+def compute_lower_bound(cost_tables, digraph_weight=1.0, single_letter_weight=0.1):
+    # Returns both bounds and the tighter of the two as "lower_bound"
+    gilmore_lawler = gilmore_lawler_bound(cost_tables, digraph_weight, single_letter_weight)
+    single_letter_assignment = single_letter_assignment_bound(cost_tables, digraph_weight, single_letter_weight)
+    return {
+        "gilmore_lawler": gilmore_lawler,
+        "single_letter_assignment": single_letter_assignment,
+        "lower_bound": max(gilmore_lawler, single_letter_assignment),
+    }
+
+
+def optimality_gap(cost, lower_bound):
+    """
+    Relative gap (cost - lower_bound) / lower_bound. Since lower_bound <= optimum,
+    cost <= optimum * (1 + gap): the layout is provably within this fraction of the optimum.
+    """
+    if cost is None or lower_bound is None or lower_bound <= 0:
+        return None
+    return max(0.0, (cost - lower_bound) / lower_bound)
+
+
+def branch_and_bound_subset(cost_tables, permutation: list, free_letter_indices: list, digraph_weight=1.0, single_letter_weight=0.1):
+    """
+    Exact solve of a subproblem: the letters in free_letter_indices are
+    rearranged over the positions they currently occupy while every other letter
+    stays put. Depth-first branch and bound, seeded with the current arrangement
+    as incumbent; practical up to roughly a dozen free letters.
+    Returns (best_permutation, best_cost, explored_nodes).
+    """
+    matrices = build_qap_matrices(cost_tables, digraph_weight, single_letter_weight)
+    flow = matrices["flow"]
+    distance = matrices["distance"]
+    linear = matrices["linear"]
+    size = len(permutation)
+
+    free_letters = list(free_letter_indices)
+    free_set = set(free_letters)
+    fixed_letters = [a for a in range(size) if a not in free_set]
+    free_positions = [permutation[a] for a in free_letters]
+
+    # Cost of a free letter on a free position, including its digraphs with fixed letters
+    placement_cost = {
+        a: {
+            p: linear[a][p] + flow[a][a] * distance[p][p] + sum(
+                flow[a][b] * distance[p][permutation[b]] + flow[b][a] * distance[permutation[b]][p]
+                for b in fixed_letters
+            )
+            for p in free_positions
+        }
+        for a in free_letters
+    }
+    fixed_cost = sum(linear[a][permutation[a]] for a in fixed_letters) + sum(
+        flow[a][b] * distance[permutation[a]][permutation[b]] for a in fixed_letters for b in fixed_letters
+    )
+    min_free_distance = min(
+        (distance[p][q] for p in free_positions for q in free_positions if p != q), default=0.0
+    )
+
+    # Heaviest letters first so the bound bites early
+    free_letters.sort(
+        key=lambda a: -sum(flow[a][b] + flow[b][a] for b in range(size) if b != a)
+    )
+
+    incumbent = list(permutation)
+    incumbent_cost = calculate_permutation_costs_batch(cost_tables, [incumbent], digraph_weight, single_letter_weight)[0][2]
+    explored_nodes = 0
+    assigned = {}
+
+    def remaining_bound(depth, open_positions):
+        bound = 0.0
+        remaining = free_letters[depth:]
+        for a in remaining:
+            bound += min(
+                placement_cost[a][p] + sum(
+                    flow[a][b] * distance[p][q] + flow[b][a] * distance[q][p] for b, q in assigned.items()
+                )
+                for p in open_positions
+            )
+        for a in remaining:
+            for b in remaining:
+                if a != b:
+                    bound += flow[a][b] * min_free_distance
+        return bound
+
+    def search(depth, partial_cost, open_positions):
+        nonlocal incumbent, incumbent_cost, explored_nodes
+        explored_nodes += 1
+        if depth == len(free_letters):
+            if partial_cost < incumbent_cost:
+                incumbent_cost = partial_cost
+                incumbent = list(permutation)
+                for a, p in assigned.items():
+                    incumbent[a] = p
+            return
+        if partial_cost + remaining_bound(depth, open_positions) >= incumbent_cost:
+            return
+
+        a = free_letters[depth]
+        options = []
+        for p in open_positions:
+            step_cost = placement_cost[a][p] + sum(
+                flow[a][b] * distance[p][q] + flow[b][a] * distance[q][p] for b, q in assigned.items()
+            )
+            options.append((step_cost, p))
+        options.sort()
+        for step_cost, p in options:
+            if partial_cost + step_cost >= incumbent_cost:
+                break
+            assigned[a] = p
+            search(depth + 1, partial_cost + step_cost, [q for q in open_positions if q != p])
+            del assigned[a]
+
+    search(0, fixed_cost, free_positions)
+    return incumbent, incumbent_cost, explored_nodes
+
+
+if __name__ == "__main__":
+    letters = list("abcdefghijklmnopqrstuvwxyzñ")
+    positions =[(1.5, 0),(2.5, 0),(3.5, 0),(4.5, 0),(5.5, 0),(6.5, 0),(7.5, 0),(8.5, 0),(9.5, 0),(10.5, 0),
+                (1.75, 1),(2.75, 1),(3.75, 1),(4.75, 1),(5.75, 1),(6.75, 1),(7.75, 1),(8.75, 1),(9.75, 1),(10.75, 1),
+                (2.25, 2),(3.25, 2),(4.25, 2),(5.25, 2),(6.25, 2),(7.25, 2),(8.25, 2)]
+
+    letter_probs = load_probability_dictionary_from_txt("annealing/files/single_char_prob.txt")
+    digraph_probs = load_probability_dictionary_from_txt("annealing/files/digraphs_prob.txt")
+    cost_tables = build_permutation_cost_tables(letters, positions, digraph_probs, letter_probs)
+
+    bounds = compute_lower_bound(cost_tables)
+    print(f"gilmore_lawler={bounds['gilmore_lawler']:.4f}  single_letter_assignment={bounds['single_letter_assignment']:.4f}")
+
+    # Gap of every finished run, plus an exact re-solve of its 8 most frequent letters
+    most_frequent = sorted(range(len(letters)), key=lambda index: -letter_probs[letters[index]])[:8]
+    file_counter = 1
+    while os.path.exists(f"annealing/result_log/results{file_counter}.txt"):
+        with open(f"annealing/result_log/results{file_counter}.txt", "r") as results:
+            layout = ast.literal_eval(results.readline().strip())
+        permutation = layout_to_permutation(layout, letters, positions)
+        cost = calculate_permutation_costs_batch(cost_tables, [permutation])[0][2]
+        _, subset_cost, explored_nodes = branch_and_bound_subset(cost_tables, permutation, most_frequent)
+        print(f"run={file_counter}  cost={cost:.4f}  gap={optimality_gap(cost, bounds['lower_bound']):.2%}  "
+              f"top8_exact={subset_cost:.4f}  nodes={explored_nodes}")
+        file_counter += 1
@@ -3,33 +3,56 @@ import os
 import time
 
 class ProgressLogger:
-    def __init__(self, filename, log_every=1000):
+    def __init__(self, filename, log_every=1000, corpus_names=None, log_gap=False):
         self.filename = filename
         self.log_every = log_every
+        # One extra "corpus_cost_<name>" column per corpus when optimizing a blend
+        self.corpus_names = list(corpus_names or [])
+        # Adds lower_bound / optimality_gap columns; the optimizer sets lower_bound
+        # from the objective it actually minimizes (see layout_bounds)
+        self.log_gap = log_gap
+        self.lower_bound = None
         self.start_time = time.time()
         self.iteration = 0
 
-        file_exists = os.path.isfile(filename)
+        columns = [
+            "iteration",
+            "elapsed_seconds",
+            "temperature",
+            "current_cost",
+            "best_cost",
+            "acceptance_ratio",
+            "digraph_cost",
+            "single_letter_cost"
+        ] + (["lower_bound", "optimality_gap"] if log_gap else []) + [f"corpus_cost_{name}" for name in self.corpus_names]
+
+        existing_columns = None
+        if os.path.isfile(filename):
+            with open(filename, "r", newline="") as existing_file:
+                existing_columns = next(csv.reader(existing_file), None)
+        # Appending rows of a different shape would make the CSV unreadable for the dashboard
+        if existing_columns is not None and existing_columns != columns:
+            raise ValueError(
+                f"{filename} already has columns {existing_columns}; cannot append rows with columns {columns}"
+            )
+
         self.file = open(filename, "a", newline="")
         self.writer = csv.writer(self.file)
 
-        if not file_exists:
-            self.writer.writerow([
-                "iteration",
-                "elapsed_seconds",
-                "temperature",
-                "current_cost",
-                "best_cost",
-                "acceptance_ratio",
-                "digraph_cost",
-                "single_letter_cost"
-            ])
+        if existing_columns is None:
+            self.writer.writerow(columns)
             self.file.flush()
 
     def should_log(self):
         return (self.iteration + 1) % self.log_every == 0
 
-    def log(self, temperature, current_cost, best_cost, accepted_moves, total_moves, digraph_cost=None, single_letter_cost=None):
+    def optimality_gap(self, best_cost):
+        # Same definition as layout_bounds.optimality_gap: (cost - bound) / bound
+        if best_cost is None or self.lower_bound is None or self.lower_bound <= 0:
+            return None
+        return max(0.0, (best_cost - self.lower_bound) / self.lower_bound)
+
+    def log(self, temperature, current_cost, best_cost, accepted_moves, total_moves, digraph_cost=None, single_letter_cost=None, corpus_costs=None):
         self.iteration += 1
 
         if self.iteration % self.log_every != 0:
@@ -37,6 +60,9 @@ class ProgressLogger:
 
         elapsed = time.time() - self.start_time
         acceptance_ratio = accepted_moves / total_moves if total_moves else 0.0
+        bound_values = []
+        if self.log_gap:
+            bound_values = [self.lower_bound, self.optimality_gap(best_cost)]
         self.writer.writerow([
             self.iteration,
             round(elapsed, 2),
@@ -46,7 +72,7 @@ class ProgressLogger:
             round(acceptance_ratio, 6),
             digraph_cost,
             single_letter_cost
-        ])
+        ] + bound_values + [(corpus_costs or {}).get(name) for name in self.corpus_names])
         self.file.flush()
         return 0, 0
 
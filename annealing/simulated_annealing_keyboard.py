@@ -4,6 +4,7 @@ import random
 import os
 from clac_layout_cost import *
 from progress_logger import ProgressLogger
+from layout_bounds import compute_lower_bound, optimality_gap
 
 
 def generate_random_layout(letters: list, positions: list):
@@ -33,12 +34,18 @@ def accetpt_neighbour(current_cost: float, neighbour_cost: float, temperature: f
     return random.random() < acceptance_probability
 
 
-def write_best_layout_snapshot(layout: dict, best_cost: float, path: str):
+def write_best_layout_snapshot(layout: dict, best_cost: float, path: str, elites=None):
     # Store as JSON so the dashboard can read it live.
     payload = {
         "best_cost": best_cost,
         "layout": {k: [v[0], v[1]] for k, v in layout.items()}
     }
+    if elites is not None:
+        # elites: list of (layout, cost) pairs, best first
+        payload["elites"] = [
+            {"cost": elite_cost, "layout": {k: [v[0], v[1]] for k, v in elite_layout.items()}}
+            for elite_layout, elite_cost in elites
+        ]
     with open(path, "w") as f:
         json.dump(payload, f)
 
@@ -50,9 +57,31 @@ def simmulated_annealing_optimize_layout(initial_layout: dict,
                                         final_temperature: float,
                                         cooling_rate: float,
                                         iterations_per_temperature: int,
-                                        logger: ProgressLogger
+                                        logger: ProgressLogger,
+                                        corpora=None,
+                                        corpus_weights=None,
+                                        stop_gap=None
                                         ):
-    
+    # With corpora ({name: (digraph_probs, letter_probs)}) the weighted blend is
+    # optimized and the best layout's cost under each corpus is logged alongside;
+    # letter_probs / digraph_probs must then be None and the logger needs matching
+    # corpus_names.
+    # stop_gap ends the run once (best_cost - lower_bound) / lower_bound <= stop_gap,
+    # i.e. the best cost is provably within that fraction of the optimum. The bound
+    # is computed here from the (blended) probabilities actually being optimized.
+    validate_corpus_arguments(digraph_probs, letter_probs, corpora, logger.corpus_names)
+    if corpora:
+        digraph_probs, letter_probs = blend_corpora(corpora, corpus_weights)
+
+    lower_bound = None
+    if logger.log_gap or stop_gap is not None:
+        # Default cost weights, the same ones calculate_keyboard_cost uses below
+        cost_tables = build_permutation_cost_tables(
+            list(initial_layout), list(initial_layout.values()), digraph_probs, letter_probs
+        )
+        lower_bound = compute_lower_bound(cost_tables)["lower_bound"]
+        logger.lower_bound = lower_bound
+
     current_layout = dict(initial_layout)
     current_cost = calculate_keyboard_cost(current_layout, digraph_probs, letter_probs)
     best_cost = current_cost
@@ -65,7 +94,8 @@ def simmulated_annealing_optimize_layout(initial_layout: dict,
     total_moves = 0
     accepted_moves = 0
     snapshot_path = "annealing/progress_logs/current_best_layout.json"
-    while current_temperature > final_temperature:
+    gap_reached = False
+    while current_temperature > final_temperature and not gap_reached:
         for i in range(iterations_per_temperature):
             neighbour_layout = swap_two_letters(current_layout)
             neighbour_cost = calculate_keyboard_cost(neighbour_layout, digraph_probs, letter_probs)
@@ -93,12 +123,19 @@ def simmulated_annealing_optimize_layout(initial_layout: dict,
                 print(f"acceptance_rate={acceptance_rate:.3f}  T={current_temperature:.3f}  current={current_cost:.3f}  best={best_cost:.3f}")
             digraph_cost = None
             single_letter_cost = None
+            corpus_costs = None
             if logger.should_log():
                 digraph_cost, single_letter_cost, _ = calculate_keyboard_cost_components(
                     current_layout,
                     digraph_probs,
                     letter_probs
                 )
+                if corpora:
+                    # Best layout, same as the genetic optimizer, so blends can be compared across runs
+                    corpus_costs = {
+                        name: components[2]
+                        for name, components in calculate_keyboard_cost_by_corpus(best_layout, corpora).items()
+                    }
             accepted_moves, total_moves = logger.log(
                 current_temperature,
                 current_cost,
@@ -106,10 +143,16 @@ def simmulated_annealing_optimize_layout(initial_layout: dict,
                 accepted_moves,
                 total_moves,
                 digraph_cost=digraph_cost,
-                single_letter_cost=single_letter_cost
+                single_letter_cost=single_letter_cost,
+                corpus_costs=corpus_costs
             )
             if total_moves == 0:
                 write_best_layout_snapshot(best_layout, best_cost, snapshot_path)
+                gap = optimality_gap(best_cost, lower_bound)
+                if stop_gap is not None and gap is not None and gap <= stop_gap:
+                    print(f"Stopping: best cost is within {gap:.2%} of the lower bound")
+                    gap_reached = True
+                    break
 
         current_temperature *= cooling_rate
     logger.close()
@@ -120,37 +163,41 @@ def simmulated_annealing_optimize_layout(initial_layout: dict,
         "temperature_history": temperature_history
     }
 
-letters = list("abcdefghijklmnopqrstuvwxyzñ")
-positions =[(1.5, 0),(2.5, 0),(3.5, 0),(4.5, 0),(5.5, 0),(6.5, 0),(7.5, 0),(8.5, 0),(9.5, 0),(10.5, 0),
-            (1.75, 1),(2.75, 1),(3.75, 1),(4.75, 1),(5.75, 1),(6.75, 1),(7.75, 1),(8.75, 1),(9.75, 1),(10.75, 1),
-            (2.25, 2),(3.25, 2),(4.25, 2),(5.25, 2),(6.25, 2),(7.25, 2),(8.25, 2)]
+if __name__ == "__main__":
+    letters = list("abcdefghijklmnopqrstuvwxyzñ")
+    positions =[(1.5, 0),(2.5, 0),(3.5, 0),(4.5, 0),(5.5, 0),(6.5, 0),(7.5, 0),(8.5, 0),(9.5, 0),(10.5, 0),
+                (1.75, 1),(2.75, 1),(3.75, 1),(4.75, 1),(5.75, 1),(6.75, 1),(7.75, 1),(8.75, 1),(9.75, 1),(10.75, 1),
+                (2.25, 2),(3.25, 2),(4.25, 2),(5.25, 2),(6.25, 2),(7.25, 2),(8.25, 2)]
 
-initial_layout = generate_random_layout(letters, positions)
-letter_probs = load_probability_dictionary_from_txt("annealing/files/single_char_prob.txt")
-digraph_probs = load_probability_dictionary_from_txt("annealing/files/digraphs_prob.txt")
+    initial_layout = generate_random_layout(letters, positions)
+    letter_probs = load_probability_dictionary_from_txt("annealing/files/single_char_prob.txt")
+    digraph_probs = load_probability_dictionary_from_txt("annealing/files/digraphs_prob.txt")
 
 
-file_counter = 1
-while os.path.exists(f"annealing/result_log/results{file_counter}.txt"):
-    file_counter += 1
+    file_counter = 1
+    # Skip numbers left behind by interrupted runs too (progress CSV without results)
+    while (os.path.exists(f"annealing/result_log/results{file_counter}.txt")
+           or os.path.exists(f"annealing/progress_logs/annealing_progress{file_counter}.csv")):
+        file_counter += 1
 
 
-logger = ProgressLogger(
-    filename=f"annealing/progress_logs/annealing_progress{file_counter}.csv",
-    log_every=1000
-)
+    logger = ProgressLogger(
+        filename=f"annealing/progress_logs/annealing_progress{file_counter}.csv",
+        log_every=1000,
+        log_gap=True
+    )
 
-best_layout, best_cost, cost_history, temperature_history = simmulated_annealing_optimize_layout(initial_layout,
-                                                                                                letter_probs,
-                                                                                                digraph_probs,
-                                                                                                initial_temperature = .1, 
-                                                                                                final_temperature = 1e-4,
-                                                                                                cooling_rate = 0.999, 
-                                                                                                iterations_per_temperature = 1000, 
-                                                                                                logger=logger).values()
+    best_layout, best_cost, cost_history, temperature_history = simmulated_annealing_optimize_layout(initial_layout,
+                                                                                                    letter_probs,
+                                                                                                    digraph_probs,
+                                                                                                    initial_temperature = .1, 
+                                                                                                    final_temperature = 1e-4,
+                                                                                                    cooling_rate = 0.999, 
+                                                                                                    iterations_per_temperature = 1000, 
+                                                                                                    logger=logger).values()
 
 
 
-results = open(f"annealing/result_log/results{file_counter}.txt", "x")
-results.write(f"{best_layout}\n{best_cost}\n{cost_history}\n{temperature_history}")
-print("Finalized")
+    results = open(f"annealing/result_log/results{file_counter}.txt", "x")
+    results.write(f"{best_layout}\n{best_cost}\n{cost_history}\n{temperature_history}")
+    print("Finalized")
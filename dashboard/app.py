@@ -1,15 +1,21 @@
 import ast
+import gzip
+import hashlib
 import json
 import os
 import re
 import pandas as pd
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, jsonify, make_response, render_template, request
 
 app = Flask(__name__)
 
 PROGRESS_DIR = "annealing/progress_logs"
 RESULTS_DIR = "annealing/result_log"
 LIVE_LAYOUT_PATH = "annealing/progress_logs/current_best_layout.json"
+CORPUS_COST_PREFIX = "corpus_cost_"
+SUMMARY_MAX_ROWS = 5000
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
 
 def list_runs():
     runs = set()
@@ -54,18 +60,22 @@ def get_latest_results_path():
             latest_path = os.path.join(RESULTS_DIR, name)
     return latest_path
 
-def load_data(max_rows=5000, run=None):
+def read_log(run=None):
     csv_path = get_csv_path(run)
     if not csv_path or not os.path.isfile(csv_path):
         return None
 
     # Read CSV; handle header-only gracefully
     try:
-        df = pd.read_csv(csv_path)
+        return pd.read_csv(csv_path)
     except Exception:
         return None
 
-    if df.shape[0] == 0:
+def load_data(max_rows=5000, run=None):
+    return prepare_data(read_log(run), max_rows=max_rows)
+
+def prepare_data(df, max_rows=5000):
+    if df is None or df.shape[0] == 0:
         return df
 
     # Keep last max_rows
@@ -97,11 +107,33 @@ def load_data(max_rows=5000, run=None):
     single_letter_weight = 0.1
     df["digraph_cost_weighted"] = df["digraph_cost"] * digraph_weight
     df["single_letter_cost_weighted"] = df["single_letter_cost"] * single_letter_weight
+    for col in get_corpus_cost_columns(df):
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    # Only runs started with a lower bound log these
+    for col in ["lower_bound", "optimality_gap"]:
+        if col not in df.columns:
+            df[col] = None
+        df[col] = pd.to_numeric(df[col], errors="coerce")
 
     return df
 
-def load_keyboard_layout(run=None):
-    latest_run = get_latest_run()
+def get_corpus_cost_columns(df):
+    # Runs optimizing a corpus blend log one "corpus_cost_<name>" column per corpus
+    return [col for col in df.columns if col.startswith(CORPUS_COST_PREFIX)]
+
+def to_json_list(series):
+    # NaN is not valid JSON; empty cells (e.g. the temperature of a genetic run) become null
+    return [None if pd.isna(v) else v for v in series.tolist()]
+
+def get_corpus_costs(df):
+    return {
+        col[len(CORPUS_COST_PREFIX):]: [None if pd.isna(v) else float(v) for v in df[col]]
+        for col in get_corpus_cost_columns(df)
+    }
+
+def load_keyboard_layout(run=None, latest_run=None):
+    if latest_run is None:
+        latest_run = get_latest_run()
     if run is None or run == latest_run:
         if os.path.isfile(LIVE_LAYOUT_PATH):
             try:
@@ -159,16 +191,9 @@ def index():
         default_run=DEFAULT_RUN,
     )
 
-@app.route("/api/data")
-def api_data():
-    max_rows = int(request.args.get("max_rows", "2000"))
-    run = parse_run_param(request.args.get("run"))
-    csv_path = get_csv_path(run)
-    df = load_data(max_rows=max_rows, run=run)
-    if df is None:
-        return jsonify({"ok": False, "error": f"Log file not found or unreadable: {csv_path}"}), 404
+def build_data_rows(df):
     if df.shape[0] == 0:
-        return jsonify({"ok": True, "rows": []})
+        return []
 
     temp_group = (
         df.groupby("temperature", dropna=True)
@@ -181,42 +206,34 @@ def api_data():
     temp_group["improvement"] = (temp_group["prev_best"] - temp_group["last_best"]).fillna(0.0)
 
     # Convert to plain lists for Chart.js
-    out = {
-        "ok": True,
-        "rows": {
-            "iteration": df["iteration"].tolist(),
-            "elapsed_seconds": df["elapsed_seconds"].tolist(),
-            "temperature": df["temperature"].tolist(),
-            "current_cost": df["current_cost"].tolist(),
-            "best_cost": df["best_cost"].tolist(),
-            "acceptance_ratio": df["acceptance_ratio"].tolist(),
-            "acceptance_rate_200": df["acceptance_rate_200"].tolist(),
-            "cost_gap": df["cost_gap"].tolist(),
-            "digraph_cost": df["digraph_cost"].tolist(),
-            "single_letter_cost": df["single_letter_cost"].tolist(),
-            "digraph_cost_weighted": df["digraph_cost_weighted"].tolist(),
-            "single_letter_cost_weighted": df["single_letter_cost_weighted"].tolist(),
-            "temp_improvement_iteration": temp_group["last_iter"].tolist(),
-            "temp_improvement": temp_group["improvement"].fillna(0).tolist(),
-        }
+    return {
+        "iteration": to_json_list(df["iteration"]),
+        "elapsed_seconds": to_json_list(df["elapsed_seconds"]),
+        "temperature": to_json_list(df["temperature"]),
+        "current_cost": to_json_list(df["current_cost"]),
+        "best_cost": to_json_list(df["best_cost"]),
+        "acceptance_ratio": to_json_list(df["acceptance_ratio"]),
+        "acceptance_rate_200": to_json_list(df["acceptance_rate_200"]),
+        "cost_gap": to_json_list(df["cost_gap"]),
+        "digraph_cost": to_json_list(df["digraph_cost"]),
+        "single_letter_cost": to_json_list(df["single_letter_cost"]),
+        "digraph_cost_weighted": to_json_list(df["digraph_cost_weighted"]),
+        "single_letter_cost_weighted": to_json_list(df["single_letter_cost_weighted"]),
+        "temp_improvement_iteration": to_json_list(temp_group["last_iter"]),
+        "temp_improvement": to_json_list(temp_group["improvement"].fillna(0)),
+        "corpus_costs": get_corpus_costs(df),
+        "lower_bound": [None if pd.isna(v) else float(v) for v in df["lower_bound"]],
     }
-    return jsonify(out)
 
-@app.route("/api/summary")
-def api_summary():
-    run = parse_run_param(request.args.get("run"))
-    csv_path = get_csv_path(run)
-    df = load_data(max_rows=5000, run=run)
-    if df is None:
-        return jsonify({"ok": False, "error": f"Log file not found or unreadable: {csv_path}"}), 404
+def build_summary(df):
     if df.shape[0] == 0:
-        return jsonify({"ok": True, "summary": {"status": "header_only"}})
+        return {"status": "header_only"}
 
     last = df.iloc[-1]
     # Overall acceptance rate (over loaded window)
     overall_acceptance = float(df["acceptance_ratio"].mean()) if df.shape[0] else 0.0
 
-    summary = {
+    return {
         "status": "running",
         "rows": int(df.shape[0]),
         "iteration": int(last["iteration"]) if pd.notna(last["iteration"]) else None,
@@ -226,8 +243,75 @@ def api_summary():
         "best_cost": float(last["best_cost"]) if pd.notna(last["best_cost"]) else None,
         "overall_acceptance": overall_acceptance,
         "acceptance_rate_200": float(last["acceptance_rate_200"]) if pd.notna(last["acceptance_rate_200"]) else None,
+        "lower_bound": float(last["lower_bound"]) if pd.notna(last["lower_bound"]) else None,
+        "optimality_gap": float(last["optimality_gap"]) if pd.notna(last["optimality_gap"]) else None,
+        "corpus_costs": {
+            col[len(CORPUS_COST_PREFIX):]: float(last[col]) if pd.notna(last[col]) else None
+            for col in get_corpus_cost_columns(df)
+        },
     }
-    return jsonify({"ok": True, "summary": summary})
+
+def build_keyboard_keys(layout):
+    keys = []
+    for letter, pos in layout.items():
+        if not isinstance(pos, (list, tuple)) or len(pos) != 2:
+            continue
+        x, y = pos
+        keys.append({"letter": letter, "x": float(x), "y": float(y)})
+    return keys
+
+def file_signature(path):
+    # (size, mtime) of a file; the CSV is append-only so its size is the log offset
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+def compute_state_etag(run, latest_run, max_rows):
+    """
+    Strong ETag for /api/state, built from file metadata only so unchanged
+    runs can be answered without reading anything.
+    """
+    csv_signature = file_signature(get_csv_path(run))
+    layout_signature = file_signature(os.path.join(RESULTS_DIR, f"results{run}.txt"))
+    if run == latest_run:
+        layout_signature = (layout_signature, file_signature(LIVE_LAYOUT_PATH))
+    key = repr((run, latest_run, max_rows, csv_signature, layout_signature))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def compressed_json_response(payload, status=200, etag=None):
+    # gzip large bodies for clients that accept it; the compressed body gets its own ETag
+    response = make_response(jsonify(payload), status)
+    response.headers["Vary"] = "Accept-Encoding"
+    accepts_gzip = "gzip" in request.headers.get("Accept-Encoding", "").lower()
+    if accepts_gzip and response.content_length and response.content_length >= GZIP_MIN_BYTES:
+        response.set_data(gzip.compress(response.get_data()))
+        response.headers["Content-Encoding"] = "gzip"
+        if etag is not None:
+            etag = f"{etag}-gzip"
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+@app.route("/api/data")
+def api_data():
+    max_rows = int(request.args.get("max_rows", "2000"))
+    run = parse_run_param(request.args.get("run"))
+    csv_path = get_csv_path(run)
+    df = load_data(max_rows=max_rows, run=run)
+    if df is None:
+        return jsonify({"ok": False, "error": f"Log file not found or unreadable: {csv_path}"}), 404
+    return jsonify({"ok": True, "rows": build_data_rows(df)})
+
+@app.route("/api/summary")
+def api_summary():
+    run = parse_run_param(request.args.get("run"))
+    csv_path = get_csv_path(run)
+    df = load_data(max_rows=SUMMARY_MAX_ROWS, run=run)
+    if df is None:
+        return jsonify({"ok": False, "error": f"Log file not found or unreadable: {csv_path}"}), 404
+    return jsonify({"ok": True, "summary": build_summary(df)})
 
 @app.route("/api/keyboard")
 def api_keyboard():
@@ -235,15 +319,47 @@ def api_keyboard():
     layout = load_keyboard_layout(run=run)
     if layout is None:
         return jsonify({"ok": False, "error": "No results layout found."}), 404
+    return jsonify({"ok": True, "keys": build_keyboard_keys(layout)})
 
-    keys = []
-    for letter, pos in layout.items():
-        if not isinstance(pos, (list, tuple)) or len(pos) != 2:
-            continue
-        x, y = pos
-        keys.append({"letter": letter, "x": float(x), "y": float(y)})
+@app.route("/api/state")
+def api_state():
+    """
+    Summary, chart rows and keyboard in one response. Clients should send back
+    the ETag in If-None-Match; while neither the log nor the layout file has
+    changed the answer is an empty 304.
+    """
+    max_rows = int(request.args.get("max_rows", "2000"))
+    latest_run = get_latest_run()
+    run = parse_run_param(request.args.get("run"))
+    if run is None:
+        run = latest_run
 
-    return jsonify({"ok": True, "keys": keys})
+    etag = compute_state_etag(run, latest_run, max_rows)
+    for known_etag in (etag, f"{etag}-gzip"):
+        if request.if_none_match.contains(known_etag):
+            response = make_response("", 304)
+            response.set_etag(known_etag)
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+
+    raw_df = read_log(run)
+    if raw_df is None:
+        return compressed_json_response(
+            {"ok": False, "error": f"Log file not found or unreadable: {get_csv_path(run)}"}, 404
+        )
+
+    layout = load_keyboard_layout(run=run, latest_run=latest_run)
+    payload = {
+        "ok": True,
+        "run": run,
+        "summary": build_summary(prepare_data(raw_df.copy(), max_rows=SUMMARY_MAX_ROWS)),
+        "rows": build_data_rows(prepare_data(raw_df.copy(), max_rows=max_rows)),
+        "keys": build_keyboard_keys(layout) if layout is not None else None,
+    }
+    response = compressed_json_response(payload, etag=etag)
+    # Always revalidate; the ETag makes that cheap
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 if __name__ == "__main__":
     # Bind to 0.0.0.0 only if you understand the security implications.